@@ -3,92 +3,259 @@
 Zero-Trust Guard (Dynamic TOTP Version)
 """
 import cv2
+import errno
 import os
 import fcntl
 import struct
 import time
 import hmac
 import hashlib
+import queue
+import signal
+import threading
 import numpy as np
+from pyzbar import pyzbar
 
 # --- CONFIGURATION ---
 DEVICE_PATH = "/dev/secret_vault"
 UNLOCK_PIN = 1337
 IOCTL_UNLOCK_CMD = 0x40047601
+# The PIN never changes at runtime, so pack the ioctl argument once
+_PIN_BYTES = struct.pack('I', UNLOCK_PIN)
 # MUST match the key in main.py
 SHARED_SECRET = b"MY_SUPER_SECRET_VAULT_KEY" 
+# Only decode every Nth grabbed frame (30fps camera -> 10fps QR checks)
+DECODE_EVERY = 3
+# QR localisation is O(pixels); detect on a downscaled copy of the frame
+DETECT_SIZE = (320, 240)
+# Capture format: 640x480 MJPEG keeps USB, decode and detect costs small
+CAPTURE_SIZE = (640, 480)
+CAPTURE_FPS = 30
+# GUARD_HEADLESS=1 skips the preview window (kiosk/server without a display)
+HEADLESS = os.environ.get("GUARD_HEADLESS") == "1"
+
+# Tokens only change once per 30s window, so cache them by window number
+_token_cache = {}
+_pack_block = struct.Struct(">Q").pack
+# Keyed HMAC state (inner/outer pads already absorbed); copy() it per token
+_hmac_template = hmac.new(SHARED_SECRET, digestmod=hashlib.sha256)
+
+def make_token(block):
+    """8 hex char token for one 30s window, matching main.py"""
+    h = _hmac_template.copy()
+    h.update(_pack_block(block))
+    return h.digest()[:4].hex().upper().encode()
 
 def generate_valid_tokens():
     """Generates valid tokens for NOW and NOW-30s (to allow for delay)"""
-    tokens = []
+    global _token_cache
     current_block = int(time.time() // 30)
-    
+    if current_block in _token_cache:
+        return _token_cache[current_block]
+
     # Check current window AND previous window (in case user is 1 second late)
-    for block in [current_block, current_block - 1]:
-        msg = struct.pack(">Q", block)
-        h = hmac.new(SHARED_SECRET, msg, hashlib.sha256).hexdigest()
-        tokens.append(h[:8].upper())
+    tokens = frozenset((make_token(current_block), make_token(current_block - 1)))
+
+    # Replace (rather than grow) the cache so older windows are evicted
+    _token_cache = {current_block: tokens}
     return tokens
 
+def is_valid_token(qr_data):
+    """Checks a scanned QR payload against the valid tokens"""
+    # Set lookup compares (salted) hashes first, so a guess only reaches a
+    # byte-wise compare on a full hash match: no prefix timing to probe
+    return qr_data.encode() in generate_valid_tokens()
+
+# Device fd kept open for the life of the guard (one ioctl per unlock)
+_vault_fd = None
+
+def open_vault():
+    """Opens DEVICE_PATH once and returns the shared fd"""
+    global _vault_fd
+    if _vault_fd is None:
+        _vault_fd = os.open(DEVICE_PATH, os.O_RDWR)
+    return _vault_fd
+
+def close_vault():
+    global _vault_fd
+    if _vault_fd is not None:
+        os.close(_vault_fd)
+        _vault_fd = None
+
 def unlock_kernel_vault():
+    global _vault_fd
     try:
-        fd = os.open(DEVICE_PATH, os.O_RDWR)
-        pin_bytes = struct.pack('I', UNLOCK_PIN)
-        fcntl.ioctl(fd, IOCTL_UNLOCK_CMD, pin_bytes)
+        try:
+            fcntl.ioctl(open_vault(), IOCTL_UNLOCK_CMD, _PIN_BYTES)
+        except OSError as e:
+            if e.errno != errno.EBADF: raise
+            # Stale fd: reopen the device once and retry
+            _vault_fd = None
+            fcntl.ioctl(open_vault(), IOCTL_UNLOCK_CMD, _PIN_BYTES)
         print("\n[+] SUCCESS: Vault Unlocked!")
-        os.close(fd)
         return True
     except Exception as e:
         print(f"\n[!] Unlock Error: {e}")
     return False
 
+def offer_frame(frames, frame):
+    """Puts frame in the single-slot queue, dropping any frame still waiting"""
+    try:
+        frames.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        frames.put_nowait(frame)
+    except queue.Full:
+        pass
+
+def detect_qr(frame):
+    """Returns (qr_data, points) for the first QR code ZBar finds in frame"""
+    # Restricting symbols disables ZBar's other (1D/EAN/...) scanners
+    decoded = pyzbar.decode(frame, symbols=[pyzbar.ZBarSymbol.QRCODE])
+    if not decoded:
+        return "", None
+    qr = decoded[0]
+    return qr.data.decode("utf-8", "replace"), np.array(qr.polygon)
+
+def detect_worker(frames, latest, lock, stop):
+    """Runs QR detection off the capture thread, always on the newest frame"""
+    gray = None
+    while not stop.is_set():
+        try:
+            frame = frames.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        # ZBar scans 8-bit gray; convert once into a buffer we reuse
+        if gray is None or gray.shape != frame.shape[:2]:
+            gray = np.empty(frame.shape[:2], dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        qr_data, points = detect_qr(gray)
+        with lock:
+            latest["qr_data"] = qr_data
+            latest["points"] = points
+
+def configure_camera(cap):
+    """Requests a small MJPEG stream and warns if the driver ignores it"""
+    # Keep only the newest frame queued so we never validate a stale QR
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAPTURE_SIZE[0])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAPTURE_SIZE[1])
+    cap.set(cv2.CAP_PROP_FPS, CAPTURE_FPS)
+
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    fourcc = "".join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4))
+    if fourcc != "MJPG":
+        print(f"[!] Camera did not accept MJPEG (using {fourcc!r})")
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if (width, height) != CAPTURE_SIZE:
+        print(f"[!] Camera resolution is {width}x{height}, not "
+              f"{CAPTURE_SIZE[0]}x{CAPTURE_SIZE[1]}")
+
+def handle_stop_signal(signum, frame):
+    """Lets SIGTERM (e.g. from a service manager) stop the guard cleanly"""
+    raise KeyboardInterrupt
+
 def start_guard():
     print("[*] Starting Dynamic TOTP Guard...")
-    detector = cv2.QRCodeDetector()
+    try:
+        open_vault()
+    except OSError as e:
+        # Not fatal: unlock_kernel_vault() retries the open when it's needed
+        print(f"[!] Cannot open {DEVICE_PATH}: {e}")
     cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
+    configure_camera(cap)
+
+    frame_idx = 0
+    # After a miss, skip token checks (but keep capturing) until this time
+    next_attempt_at = 0.0
+    # Last detected corners and the int32 outline drawn for them
+    last_points, last_outline = None, None
+    # Without a window there is no 'q' key; SIGINT/SIGTERM stop the loop
+    signal.signal(signal.SIGTERM, handle_stop_signal)
+
+    # --- DETECTION THREAD ---
+    frames = queue.Queue(maxsize=1)
+    latest = {"qr_data": "", "points": None}
+    lock = threading.Lock()
+    stop = threading.Event()
+    worker = threading.Thread(target=detect_worker,
+                              args=(frames, latest, lock, stop),
+                              daemon=True)
+    worker.start()
 
     try:
         while True:
-            ret, frame = cap.read()
+            # grab() every frame to keep the camera queue drained, but only
+            # pay for the BGR decode on the frames we actually inspect
+            if not cap.grab(): break
+            frame_idx += 1
+            if frame_idx % DECODE_EVERY: continue
+
+            ret, frame = cap.retrieve()
             if not ret: break
 
-            qr_data, points, _ = detector.detectAndDecode(frame)
+            # The worker gets its own downscaled copy; we draw on `frame` below
+            small = cv2.resize(frame, DETECT_SIZE, interpolation=cv2.INTER_AREA)
+            offer_frame(frames, small)
+
+            # Consume the most recent detection result (if any)
+            with lock:
+                qr_data, points = latest["qr_data"], latest["points"]
+                latest["qr_data"], latest["points"] = "", None
+
+            # Rate limiting: right after an invalid token, decoded frames are
+            # discarded instead of validated, without stalling capture
+            if qr_data and time.monotonic() < next_attempt_at:
+                qr_data = ""
 
             if qr_data:
                 # --- VISUALS ---
-                if points is not None:
-                    if len(points.shape) == 3: points = points[0]
-                    points = points.astype(int)
-                    for i in range(4):
-                        cv2.line(frame, tuple(points[i]), tuple(points[(i+1)%4]), (0, 255, 0), 3)
+                if not HEADLESS and points is not None:
+                    # A stationary QR keeps reporting the same corners;
+                    # only rescale/cast when they actually move
+                    if last_points is None or not np.array_equal(points, last_points):
+                        # Map corners from the detection size back to the frame
+                        scale = (frame.shape[1] / DETECT_SIZE[0],
+                                 frame.shape[0] / DETECT_SIZE[1])
+                        pts = (points.reshape(-1, 2) * scale).astype(np.int32)
+                        last_points, last_outline = points, pts.reshape((-1, 1, 2))
+                    # One closed polyline instead of a cv2.line per edge
+                    cv2.polylines(frame, [last_outline], True, (0, 255, 0), 3)
 
                 # --- DYNAMIC VALIDATION ---
-                valid_tokens = generate_valid_tokens()
-                
-                if qr_data in valid_tokens:
+                if is_valid_token(qr_data):
                     print(f"[+] VALID TOTP TOKEN: {qr_data}")
                     unlock_kernel_vault()
                     
                     # Success Animation
-                    cv2.putText(frame, "ACCESS GRANTED", (50, 50), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                    cv2.imshow('Zero-Trust Guard', frame)
-                    cv2.waitKey(2000)
+                    if not HEADLESS:
+                        cv2.putText(frame, "ACCESS GRANTED", (50, 50), 
+                                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                        cv2.imshow('Zero-Trust Guard', frame)
+                        cv2.waitKey(2000)
                     break 
                 else:
-                    # Print invalid only occasionally
+                    # One attempt per second, without stalling capture
                     print(f"[-] Invalid/Expired Token: {qr_data}")
-                    time.sleep(1)
+                    next_attempt_at = time.monotonic() + 1.0
 
-            cv2.imshow('Zero-Trust Guard', frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'): break
+            if not HEADLESS:
+                cv2.imshow('Zero-Trust Guard', frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'): break
                 
     except KeyboardInterrupt:
         print("\n[*] Interrupted")
     finally:
+        stop.set()
+        worker.join(timeout=1)
         cap.release()
-        cv2.destroyAllWindows()
-        cv2.waitKey(1)
+        close_vault()
+        if not HEADLESS:
+            cv2.destroyAllWindows()
+            cv2.waitKey(1)
         print("[*] Guard stopped.")
         os._exit(0)
 
@@ -80,6 +80,7 @@ install_system_deps() {
             python3-venv \
             build-essential \
             linux-headers-$(uname -r) \
+            libzbar0 \
             pkg-config
     elif command -v yum &> /dev/null; then
         # RHEL/CentOS/Fedora
@@ -91,6 +92,7 @@ install_system_deps() {
             gcc \
             make \
             kernel-devel-$(uname -r) \
+            zbar \
             pkgconfig
     elif command -v dnf &> /dev/null; then
         # Fedora
@@ -102,6 +104,7 @@ install_system_deps() {
             gcc \
             make \
             kernel-devel-$(uname -r) \
+            zbar \
             pkgconfig
     else
         print_error "Unsupported package manager. Please install dependencies manually."
@@ -117,10 +120,10 @@ install_python_deps() {
     print_info "Installing Python dependencies..."
     
     # Install core requirements
-    pip3 install --user opencv-python qrcode[pil]
+    pip3 install --user opencv-python pyzbar qrcode[pil]
     
     # Check installation
-    if python3 -c "import cv2, qrcode" 2>/dev/null; then
+    if python3 -c "import cv2, pyzbar.pyzbar, qrcode" 2>/dev/null; then
         print_success "Core Python dependencies installed"
     else
         print_error "Failed to install Python dependencies"
@@ -210,7 +213,7 @@ verify_installation() {
     fi
     
     # Test Python dependencies
-    if python3 -c "import cv2, qrcode" 2>/dev/null; then
+    if python3 -c "import cv2, pyzbar.pyzbar, qrcode" 2>/dev/null; then
         print_success "✓ Python dependencies working"
     else
         print_error "✗ Python dependencies not working"
@@ -19,8 +19,9 @@ source.include_exts = py,png,jpg,kv
 version = 1.0.0
 
 # (list) Application requirements
-# FIX 1: Removed 'pillow' and 'qrcode[pil]'. Pure python qrcode only.
-requirements = python3,kivy,qrcode
+# FIX 1: No pillow/qrcode. Pure python segno only; NumPy stays optional
+# (main.py falls back to bytes.translate) to keep the APK small.
+requirements = python3,kivy,segno
 
 # (str) Icon of the application
 #icon.filename = %(source.dir)s/icon.png
@@ -8,18 +8,54 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.anchorlayout import AnchorLayout
 from kivy.uix.label import Label
 from kivy.uix.image import Image
+from kivy.uix.widget import Widget
 from kivy.clock import Clock
+from kivy.graphics import Mesh
 from kivy.graphics.texture import Texture
 from kivy.core.window import Window
 from kivy.lang import Builder
-import qrcode
+from kivy.metrics import dp
+import functools
 import time
 import hmac
 import hashlib
 import struct
 
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; fall back to pure Python pixels
+    np = None
+
 # --- CONFIGURATION ---
 SHARED_SECRET = b"MY_SUPER_SECRET_VAULT_KEY"
+# Pre-parsed ">Q" packer for the 30s block number (same as guard.py)
+_pack_block = struct.Struct(">Q").pack
+
+# The QR is pure black/white, so it is uploaded as a 1 byte/pixel
+# 'luminance' texture. Translation table for QR module values:
+# 0 -> white, 1 -> black
+PIXEL_LUT = bytes.maketrans(b"\x00\x01", b"\xff\x00")
+
+@functools.lru_cache(maxsize=8)
+def qr_modules(data):
+    """Encodes data once and returns (size, modules): one 0/1 byte per
+    module, row-major. Immutable, so repeated tokens are cache hits"""
+    # Standard "No-Dependency" QR Generation (segno needs no PIL)
+    # make_qr() so segno never picks a Micro QR, which the guard can't read
+    # segno's matrix has no quiet zone; we sit inside a white frame anyway
+    # Imported on first use; the first rotation runs after the first frame
+    import segno
+    matrix = segno.make_qr(data, error='l').matrix
+    return len(matrix), b"".join(matrix)
+
+def matrix_to_pixels(mask, out):
+    """Writes black (data) / white (background) luminance pixels for a
+    boolean QR mask into the preallocated uint8 array out of shape (h, w)"""
+    # Branchless 255 - 255 * mask: 0 for data, 255 for background. Two
+    # in-place ufunc passes, no compare/blend and no temporary array
+    np.multiply(mask, np.uint8(255), out=out)
+    np.subtract(np.uint8(255), out, out=out)
+    return out
 
 # --- Kivy Language Styling (KV) ---
 # This defines the look and feel: colors, rounded corners, and layout structure.
@@ -64,27 +100,11 @@ KV_STYLES = """
             size: self.size
             radius: [dp(15),]
 
-# The visual "scanner brackets" overlay
-<ScannerOverlay@Widget>:
-    canvas:
+# The visual "scanner brackets" overlay (geometry lives in ScannerOverlay)
+<ScannerOverlay>:
+    canvas.before:
         Color:
             rgba: color_accent
-        Line:
-            width: dp(2)
-            # Top Left corner
-            points: [self.x, self.top - dp(20), self.x, self.top, self.x + dp(20), self.top]
-        Line:
-            width: dp(2)
-            # Top Right corner
-            points: [self.right - dp(20), self.top, self.right, self.top, self.right, self.top - dp(20)]
-        Line:
-            width: dp(2)
-            # Bottom Left corner
-            points: [self.x, self.y + dp(20), self.x, self.y, self.x + dp(20), self.y]
-        Line:
-            width: dp(2)
-            # Bottom Right corner
-            points: [self.right - dp(20), self.y, self.right, self.y, self.right, self.y + dp(20)]
 
 # Bottom Navigation Item style
 <NavItem@BoxLayout>:
@@ -177,12 +197,44 @@ KV_STYLES = """
             icon_text: 'S'
             label_text: 'Settings'
 """
-# Load style definitions
-Builder.load_string(KV_STYLES)
 
 class RootLayout(BoxLayout):
     pass
 
+class ScannerOverlay(Widget):
+    """Yellow corner brackets, batched into a single Mesh (one draw call)
+    instead of four separate Line instructions"""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        with self.canvas:
+            self._mesh = Mesh(mode='triangles')
+        self.bind(pos=self._update_mesh, size=self._update_mesh)
+        self._update_mesh()
+
+    def _update_mesh(self, *args):
+        arm, half = dp(20), dp(2)  # bracket arm length, half line width
+        x, y, right, top = self.x, self.y, self.right, self.top
+        segments = [
+            # Top Left corner
+            (x, top - arm, x, top), (x, top, x + arm, top),
+            # Top Right corner
+            (right - arm, top, right, top), (right, top, right, top - arm),
+            # Bottom Left corner
+            (x, y + arm, x, y), (x, y, x + arm, y),
+            # Bottom Right corner
+            (right - arm, y, right, y), (right, y, right, y + arm),
+        ]
+        vertices, indices = [], []
+        for x1, y1, x2, y2 in segments:
+            # Each axis-aligned segment becomes a quad of two triangles
+            x1, x2 = min(x1, x2) - half, max(x1, x2) + half
+            y1, y2 = min(y1, y2) - half, max(y1, y2) + half
+            i = len(vertices) // 4
+            vertices += [x1, y1, 0, 0, x2, y1, 0, 0, x2, y2, 0, 0, x1, y2, 0, 0]
+            indices += [i, i + 1, i + 2, i, i + 2, i + 3]
+        self._mesh.vertices = vertices
+        self._mesh.indices = indices
+
 class MainUI(RootLayout):
     """The main application layout defined in KV structure above"""
     pass
@@ -192,6 +244,9 @@ class VaultKeyApp(App):
         # Set window size for desktop testing to match phone aspect ratio
         # Window.size = (350, 700) 
         
+        # Load style definitions (parsed here rather than at import time)
+        Builder.load_string(KV_STYLES)
+        
         # Initialize the main UI defined in KV
         self.root_widget = MainUI()
         
@@ -201,11 +256,27 @@ class VaultKeyApp(App):
         self.timer_label = self.root_widget.ids.timer_label_widget
         
         self.last_generated_time_block = 0
+        # Wall-clock second at which the next 30s block starts, and the
+        # one-shot Clock event armed for it
+        self._next_rotation_ts = 0
+        self._rotate_event = None
+        # Keyed HMAC state; copy() it per block instead of re-keying
+        self._hmac_template = hmac.new(SHARED_SECRET, b"", hashlib.sha256)
+        # Last QR payload, its pixels and the texture they are blitted into.
+        # The texture is reused across rotations while the QR size is stable
+        self._cached_data = None
+        self._qr_pixels = None
+        self._qr_tex = None
+        # NumPy pixel buffer reused across rotations (same lifetime as the
+        # texture: only reallocated if the QR size changes)
+        self._pixbuf = None
         
-        # Run the update loop every 1 second
-        Clock.schedule_interval(self.update_state, 1)
-        # Generate immediately on start
-        self.update_state(0)
+        # Cheap 1 second countdown; the token/QR only change on boundaries
+        Clock.schedule_interval(self._tick_timer, 1)
+        # Generate on the first frame rather than inside build(), so the
+        # segno import and first encode stay off the cold-start path
+        # (this also arms the next rotation)
+        self._rotate_event = Clock.schedule_once(self._rotate, 0)
         
         return self.root_widget
 
@@ -216,42 +287,84 @@ class VaultKeyApp(App):
         if time_block == self.last_generated_time_block:
             return None
         self.last_generated_time_block = time_block
-        msg = struct.pack(">Q", time_block)
-        h = hmac.new(SHARED_SECRET, msg, hashlib.sha256).hexdigest()
-        return h[:8].upper()
+        h = self._hmac_template.copy()
+        h.update(_pack_block(time_block))
+        # Hex-encode only the 4 bytes we show (same as hexdigest()[:8])
+        return h.digest()[:4].hex().upper()
 
-    def update_state(self, dt):
+    def _tick_timer(self, dt):
         # Update Timer Text
-        seconds_remaining = 30 - (int(time.time()) % 30)
+        seconds_remaining = self._next_rotation_ts - int(time.time())
+        # The Clock runs on monotonic time, so a wall-clock jump (suspend,
+        # NTP step) would strand the one-shot rotation: resync right away
+        if not 0 < seconds_remaining <= 30:
+            if self._rotate_event is not None:
+                self._rotate_event.cancel()
+            self._rotate(0)
+            return
         self.timer_label.text = f"Refreshing token in: {seconds_remaining}s"
-        
+
+    def _rotate(self, dt):
         # Check for new token block
         new_token = self.get_totp_token()
         if new_token:
             self.generate_qr(new_token)
             # Update main token text
             self.token_label.text = new_token
+        
+        # Re-arm for the next block boundary. If the Clock fired a hair
+        # early we are still in the old block and simply re-arm for it
+        now = time.time()
+        self._next_rotation_ts = (int(now) // 30 + 1) * 30
+        self._rotate_event = Clock.schedule_once(
+            self._rotate, self._next_rotation_ts - now)
+        self._tick_timer(0)
+
+    def on_resume(self):
+        # Catch up on a rotation missed while paused, otherwise re-apply
+        # the cached texture rather than re-encoding the same token
+        if self._rotate_event is not None:
+            self._rotate_event.cancel()
+        self._rotate(0)
+        if self._cached_data:
+            self.generate_qr(self._cached_data)
 
     def generate_qr(self, data):
-        # Standard "No-Dependency" QR Generation
-        # IMPORTANT: border=0 because we are putting it inside a white frame anyway
-        qr = qrcode.QRCode(box_size=1, border=0) 
-        qr.add_data(data)
-        qr.make(fit=True)
-        matrix = qr.get_matrix()
-        
-        buff = bytearray()
-        for row in matrix:
-            for val in row:
-                # Black pixels for data, White for background
-                buff.extend([0, 0, 0] if val else [255, 255, 255])
+        if data == self._cached_data and self._qr_tex is not None:
+            self.qr_image.texture = self._qr_tex
+            return
+
+        size, modules = qr_modules(data)
+        if np is not None:
+            # Pixels are written in place into the buffer handed to blit_buffer
+            mask = np.frombuffer(modules, dtype=np.bool_).reshape(size, size)
+            if self._pixbuf is None or self._pixbuf.shape != (size, size):
+                self._pixbuf = np.empty((size, size), dtype=np.uint8)
+            matrix_to_pixels(mask, self._pixbuf)
+            # Flat byte view; blit_buffer takes any buffer, no bytes copy
+            buff = memoryview(self._pixbuf).cast('B')
+        else:
+            # No NumPy (e.g. slim APK): modules are exactly 0/1 bytes,
+            # so map them to pixels with one C translate
+            buff = modules.translate(PIXEL_LUT)
         
-        size = len(matrix)
-        texture = Texture.create(size=(size, size), colorfmt='rgb')
-        texture.blit_buffer(bytes(buff), colorfmt='rgb', bufferfmt='ubyte')
-        # Nearest neighbor for sharp pixel look
-        texture.mag_filter = 'nearest' 
-        self.qr_image.texture = texture
+        self._qr_pixels = buff
+        self._cached_data = data
+        if self._qr_tex is None or self._qr_tex.size != (size, size):
+            self._qr_tex = Texture.create(size=(size, size), colorfmt='luminance')
+            # Nearest neighbor for sharp pixel look
+            self._qr_tex.mag_filter = 'nearest' 
+            # Re-upload our pixels if the GL context is lost (Android pause)
+            self._qr_tex.add_reload_observer(self._reload_qr)
+            self._qr_tex.blit_buffer(buff, colorfmt='luminance', bufferfmt='ubyte')
+            self.qr_image.texture = self._qr_tex
+        else:
+            # Same GL texture, new pixels: just re-blit and redraw
+            self._qr_tex.blit_buffer(buff, colorfmt='luminance', bufferfmt='ubyte')
+            self.qr_image.canvas.ask_update()
+
+    def _reload_qr(self, texture):
+        texture.blit_buffer(self._qr_pixels, colorfmt='luminance', bufferfmt='ubyte')
 
 if __name__ == '__main__':
     VaultKeyApp().run()